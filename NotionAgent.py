@@ -1,11 +1,22 @@
 import streamlit as st
 import re
+import asyncio
+import hashlib
 import logging
-from typing import List, Dict, Set, Optional, Callable
-
-import google.generativeai as genai
-from notion_client import Client
-from notion_client.errors import APIResponseError
+import random
+import ssl
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, List, Dict, Set, Optional, Callable, Tuple, Union
+
+import diskcache
+from google import genai
+from google.genai import types
+import httpx
+import orjson
+from notion_client import AsyncClient
+from notion_client.errors import APIResponseError, HTTPResponseError
 
 # ------------------------------------------------------------------------------
 # Configure Logging and API Keys
@@ -18,28 +29,213 @@ NOTION_API_KEY = st.secrets.get("NOTION_API_KEY", "your-notion-api-key")
 # Use your Gemini API key from secrets; a default is provided if not set.
 GEMINI_API_KEY = st.secrets.get("GEMINI_API_KEY")
 
-# Initialize the Notion client and configure Gemini.
-notion = Client(auth=NOTION_API_KEY)
-genai.configure(api_key=GEMINI_API_KEY)
+# The Gemini client is built on first use (see get_gemini_client) and the
+# Notion client per fetch (see fetch_notion_content).
+
+# Notion rate-limits integrations to an average of three requests per second but
+# allows bursts; requests beyond that get HTTP 429 and are retried below.
+NOTION_MAX_CONCURRENT_REQUESTS = 8
+NOTION_MAX_RETRIES = 5
+# Back-off (seconds) before the first retry when Notion sends no Retry-After.
+NOTION_RETRY_BASE_DELAY = 0.5
+# Largest page size Notion accepts, and how many pages a listing may run ahead.
+NOTION_PAGE_SIZE = 100
+NOTION_PREFETCH_PAGES = 4
+# Worker tasks draining the crawl queue; requests stay capped by the client.
+NOTION_CRAWL_WORKERS = 8
+# Keep-alive pool for Notion requests; with HTTP/2 they share one connection.
+NOTION_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+# On-disk store of children listings, used only when "Force refresh" is unticked.
+# Entries are keyed by the enclosing page's last_edited_time, which any edit on
+# the page advances, and expire after the TTL so the store does not grow forever.
+NOTION_LISTING_CACHE_DIR = ".notion_cache"
+NOTION_LISTING_CACHE_TTL_SECONDS = 60 * 60
+# Notion rounds last_edited_time down to the minute, so a listing read within
+# this long of its page's timestamp may predate an edit stamped the same; such
+# listings are not stored.
+NOTION_EDIT_SETTLE_SECONDS = 2 * 60
+
+# ------------------------------------------------------------------------------
+# Notion Client
+# ------------------------------------------------------------------------------
+
+def retry_delay(error: HTTPResponseError, attempt: int) -> Optional[float]:
+    """
+    Returns how long to wait before retrying a failed request, or None if the
+    error is not retryable. Rate limits (429) honour Notion's Retry-After header;
+    server errors and header-less 429s back off exponentially with jitter.
+    """
+    if error.status != 429 and error.status < 500:
+        return None
+    retry_after = error.headers.get("Retry-After")
+    if error.status == 429 and retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return NOTION_RETRY_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+
+class _RateLimitedClient(AsyncClient):
+    """
+    Async Notion client that caps the number of requests in flight at once and
+    retries rate-limited (429) and server-error responses. A Retry-After from any
+    request pauses all of them, rather than letting the others keep tripping it.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        max_concurrent_requests: int = NOTION_MAX_CONCURRENT_REQUESTS,
+        listing_cache: Optional[diskcache.Cache] = None,
+        **kwargs: Any
+    ):
+        super().__init__(*args, **kwargs)
+        self._request_slots = asyncio.Semaphore(max_concurrent_requests)
+        # Where list_block_children keeps listings across runs; None disables it.
+        self.listing_cache = listing_cache
+        # Event-loop time before which no new request may start.
+        self._resume_at = 0.0
+
+    def _parse_response(self, response: httpx.Response) -> Any:
+        # Listings are large JSON bodies decoded between requests on the event
+        # loop; orjson decodes them faster. Errors keep the stock handling.
+        if response.is_success:
+            return orjson.loads(response.content)
+        return super()._parse_response(response)
+
+    async def request(self, *args: Any, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            async with self._request_slots:
+                pause = self._resume_at - loop.time()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                try:
+                    return await super().request(*args, **kwargs)
+                except HTTPResponseError as e:
+                    delay = retry_delay(e, attempt)
+                    if delay is None or attempt >= NOTION_MAX_RETRIES:
+                        raise
+                    status = e.status
+            logger.warning(f"Notion returned {status}; retrying in {delay:.1f}s (attempt {attempt + 1})")
+            if status == 429:
+                self._resume_at = max(self._resume_at, loop.time() + delay)
+            else:
+                await asyncio.sleep(delay)
+            attempt += 1
+
+async def paginate(
+    list_fn: Callable[..., Awaitable[Dict]],
+    page_size: int = NOTION_PAGE_SIZE,
+    prefetch: int = NOTION_PREFETCH_PAGES,
+    **kwargs: Any
+) -> AsyncIterator[Dict]:
+    """
+    Yields the responses of a paginated Notion listing in order.
+    Cursors are opaque, so a background task requests each next page as soon
+    as the previous one arrives, buffering up to `prefetch` pages while the
+    caller processes earlier ones. Both block listings and database queries go
+    through here, so neither waits on its own processing between pages.
+    """
+    pages: asyncio.Queue = asyncio.Queue(maxsize=prefetch)
+
+    async def produce():
+        cursor = None
+        try:
+            while True:
+                response = await list_fn(start_cursor=cursor, page_size=page_size, **kwargs)
+                await pages.put(response)
+                if not response.get("has_more"):
+                    break
+                cursor = response.get("next_cursor")
+        except Exception as e:
+            await pages.put(e)
+        await pages.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            response = await pages.get()
+            if response is None:
+                break
+            if isinstance(response, Exception):
+                raise response
+            yield response
+    finally:
+        producer.cancel()
+
+def is_settled(last_edited_time: str) -> bool:
+    """
+    Returns whether a Notion timestamp is old enough that no later edit can
+    still be stamped with it (see NOTION_EDIT_SETTLE_SECONDS).
+    """
+    try:
+        edited = datetime.fromisoformat(last_edited_time.replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    return (datetime.now(timezone.utc) - edited).total_seconds() >= NOTION_EDIT_SETTLE_SECONDS
+
+async def list_block_children(
+    notion: _RateLimitedClient,
+    block_id: str,
+    page_edited: Optional[str] = None
+) -> AsyncIterator[Dict]:
+    """
+    Yields the responses of a block's children listing, like paginate. If the
+    client has a listing cache and `page_edited`, the `last_edited_time` of the
+    page the block belongs to, is known, a listing stored while the page was at
+    that same edit is replayed instead of calling the API.
+    """
+    cache = notion.listing_cache
+    if cache is None or not page_edited:
+        async for response in paginate(notion.blocks.children.list, block_id=block_id):
+            yield response
+        return
+    key = f"{block_id}@{page_edited}"
+    responses = cache.get(key)
+    if responses is not None:
+        for response in responses:
+            yield response
+        return
+    responses = []
+    async for response in paginate(notion.blocks.children.list, block_id=block_id):
+        responses.append(response)
+        yield response
+    # Only complete listings are stored; an error above skips this.
+    if is_settled(page_edited):
+        cache.set(key, responses, expire=NOTION_LISTING_CACHE_TTL_SECONDS)
 
 # ------------------------------------------------------------------------------
-# Helper Functions for Notion Parsing and Recursion
+# Helper Functions for Notion Parsing and Crawling
 # ------------------------------------------------------------------------------
 
+# Compiled once at import and dispatched on by extract_page_id.
+_WORKSPACE_URL_PATTERN = re.compile(r'notion\.so/[^/]+/[^-]+-([a-f0-9]{32})')  # Workspace/page-name format
+_DIRECT_ID_PATTERN = re.compile(r'([a-f0-9]{32})')                            # Direct ID
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
 def extract_page_id(url: str) -> str:
     """
     Extracts the 32-digit page ID from a Notion URL and formats it as a UUID.
     """
-    patterns = [
-        r'notion\.so/[^/]+/[^-]+-([a-f0-9]{32})',  # Workspace/page-name format
-        r'([a-f0-9]{32})',                        # Direct ID
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            page_id = match.group(1)
-            return f"{page_id[:8]}-{page_id[8:12]}-{page_id[12:16]}-{page_id[16:20]}-{page_id[20:]}"
-    raise ValueError("Could not extract page ID from URL.")
+    # Every pattern needs 32 hex digits; anything shorter cannot match.
+    if len(url) < 32:
+        raise ValueError("Could not extract page ID from URL.")
+    if len(url) == 32 and _HEX_DIGITS.issuperset(url):
+        # A bare ID needs no regex at all.
+        page_id = url
+    else:
+        match = None
+        # The workspace pattern needs a literal "notion.so"; skip it otherwise.
+        if "notion.so" in url:
+            match = _WORKSPACE_URL_PATTERN.search(url)
+        if not match:
+            match = _DIRECT_ID_PATTERN.search(url)
+        if not match:
+            raise ValueError("Could not extract page ID from URL.")
+        page_id = match.group(1)
+    return str(uuid.UUID(page_id))
 
 def safe_get_text(content: Dict, field: str) -> str:
     """
@@ -47,11 +243,21 @@ def safe_get_text(content: Dict, field: str) -> str:
     """
     try:
         text_array = content.get(field, [])
+        if not text_array:
+            return ""
+        # Rich-text arrays of span dicts are by far the most common shape, so
+        # they are tried first with exact type checks and a plain subscript;
+        # anything unusual falls through to the per-item checks below.
+        if type(text_array) is list:
+            try:
+                return " ".join([text["plain_text"] for text in text_array])
+            except (KeyError, TypeError):
+                pass
         if isinstance(text_array, list):
-            return " ".join(
+            return " ".join([
                 text.get("plain_text", "") if isinstance(text, dict) else str(text)
                 for text in text_array
-            )
+            ])
         elif isinstance(text_array, dict):
             return text_array.get("plain_text", "")
         elif isinstance(text_array, str):
@@ -61,285 +267,562 @@ def safe_get_text(content: Dict, field: str) -> str:
         logger.debug(f"Error extracting text from {field}: {str(e)}")
         return ""
 
-def get_block_text(block: Dict) -> str:
+def get_page_title(page: Dict) -> str:
     """
-    Extracts text content from a block's available text fields.
+    Returns the title property of a page object, or "" if it has none.
     """
-    if not block or "type" not in block:
-        return ""
-    block_type = block["type"]
-    block_content = block.get(block_type, {})
-    for field in ["text", "rich_text", "title", "content"]:
+    for prop in page.get("properties", {}).values():
+        if prop.get("type") == "title":
+            return safe_get_text(prop, "title")
+    return ""
+
+# Where each block type keeps its text, following Notion's block schema.
+# Types not listed here probe every field the API has ever used for text.
+_TEXT_FIELDS_FOR_TYPE: Dict[str, Tuple[str, ...]] = {
+    **dict.fromkeys(
+        ("paragraph", "heading_1", "heading_2", "heading_3", "bulleted_list_item",
+         "numbered_list_item", "toggle", "to_do", "quote", "callout", "code"),
+        ("rich_text",),
+    ),
+    "child_page": ("title",),
+    "child_database": ("title",),
+}
+_UNKNOWN_TYPE_TEXT_FIELDS = ("rich_text", "text", "title", "content")
+
+def get_block_text(block: Dict, block_type: Optional[str] = None, block_content: Optional[Dict] = None) -> str:
+    """
+    Extracts text content from the text fields Notion uses for the block's type.
+    Callers that already know the block's type can pass it as `block_type`, and
+    the block's type-specific object (`block[block_type]`) as `block_content`.
+    """
+    if block_type is None:
+        if not block or "type" not in block:
+            return ""
+        block_type = block["type"]
+    if block_content is None:
+        block_content = block.get(block_type, {})
+    fields = _TEXT_FIELDS_FOR_TYPE.get(block_type, _UNKNOWN_TYPE_TEXT_FIELDS)
+    if fields[0] == "rich_text":
+        # Most blocks keep their text in rich_text; handle that inline.
+        rich_text = block_content.get("rich_text")
+        if type(rich_text) is list and rich_text:
+            try:
+                text = " ".join([t["plain_text"] for t in rich_text])
+            except (KeyError, TypeError):
+                text = safe_get_text(block_content, "rich_text")
+            if text:
+                return text
+        fields = fields[1:]
+    for field in fields:
         text = safe_get_text(block_content, field)
         if text:
             return text
-    if block_type == "child_page":
-        return block_content.get("title", "")
     return ""
 
-def process_block(block: Dict) -> str:
+# Formatters keyed by block type; each takes the block's text and its
+# type-specific object (e.g. block["to_do"] for a to_do block).
+# Types without an entry (e.g. paragraph) use _format_plain.
+_BLOCK_FORMATTERS: Dict[str, Callable[[str, Dict], str]] = {
+    "heading_1": lambda text, content: f"\n# {text}\n",
+    "heading_2": lambda text, content: f"\n## {text}\n",
+    "heading_3": lambda text, content: f"\n### {text}\n",
+    "bulleted_list_item": lambda text, content: f"• {text}",
+    "numbered_list_item": lambda text, content: f"• {text}",
+    "toggle": lambda text, content: f"▶ {text}",
+    "to_do": lambda text, content: f"{'[x]' if content.get('checked', False) else '[ ]'} {text}",
+    "code": lambda text, content: f"\n```{content.get('language', '')}\n{text}\n```\n",
+    "quote": lambda text, content: f"> {text}",
+    "callout": lambda text, content: f"{content.get('icon', {}).get('emoji', '')} {text}",
+}
+
+def _format_plain(text: str, content: Dict) -> str:
+    return text
+
+# Block types that never carry text; process_block skips extraction for them.
+_NO_TEXT_BLOCK_TYPES = frozenset({
+    "divider", "image", "video", "file", "pdf", "equation",
+    "table_of_contents", "breadcrumb", "column_list", "column",
+})
+
+def process_block(block: Dict, block_type: Optional[str] = None) -> str:
     """
     Processes a block and returns its formatted content based on its type.
+    Callers that already know the block's type can pass it as `block_type`.
     """
-    if not block or "type" not in block:
+    if block_type is None:
+        if not block or "type" not in block:
+            return ""
+        block_type = block["type"]
+    if block_type in _NO_TEXT_BLOCK_TYPES:
         return ""
-    block_type = block["type"]
-    text = get_block_text(block)
+    # Look up the type-specific object once for both extraction and formatting.
+    block_content = block.get(block_type, {})
+    text = get_block_text(block, block_type, block_content)
     if not text.strip():
         return ""
+    return _BLOCK_FORMATTERS.get(block_type, _format_plain)(text, block_content)
 
-    if block_type == "heading_1":
-        return f"\n# {text}\n"
-    elif block_type == "heading_2":
-        return f"\n## {text}\n"
-    elif block_type == "heading_3":
-        return f"\n### {text}\n"
-    elif block_type in ["bulleted_list_item", "numbered_list_item"]:
-        return f"• {text}"
-    elif block_type == "paragraph":
-        return text
-    elif block_type == "toggle":
-        return f"▶ {text}"
-    elif block_type == "to_do":
-        checked = block.get(block_type, {}).get("checked", False)
-        return f"{'[x]' if checked else '[ ]'} {text}"
-    elif block_type == "code":
-        language = block.get(block_type, {}).get("language", "")
-        return f"\n```{language}\n{text}\n```\n"
-    elif block_type == "quote":
-        return f"> {text}"
-    elif block_type == "callout":
-        emoji = block.get(block_type, {}).get("icon", {}).get("emoji", "")
-        return f"{emoji} {text}"
-    return text
+# Formatted output of a subtree. Each nested page, database or block gets its
+# own list, placed in its parent's list and filled in when its fetch runs.
+Fragments = List[Union[str, "Fragments"]]
+
+# Queues a fetch: (fetch function, object id, output list, indent, and the
+# last_edited_time of the page the object belongs to, if freshly known).
+Enqueue = Callable[[Callable[..., Awaitable[None]], str, Fragments, int, Optional[str]], None]
 
-def fetch_database_entries(
+def write_blocks(write: Callable[[str], None], content_blocks: Fragments) -> None:
+    """
+    Passes formatted blocks to `write` in document order, separated by blank lines.
+    This is the only place the output is assembled: crawl workers finish out of
+    order, so they fill per-subtree lists instead of writing directly, and
+    nothing is joined or flattened along the way.
+    """
+    first = True
+    stack = [iter(content_blocks)]
+    while stack:
+        for item in stack[-1]:
+            if not isinstance(item, str):
+                stack.append(iter(item))
+                break
+            if not first:
+                write("\n\n")
+            write(item)
+            first = False
+        else:
+            stack.pop()
+
+# Block types whose text runs together into one fragment until another type appears.
+_GROUPED_BLOCK_TYPES = frozenset({"bulleted_list_item", "numbered_list_item", "paragraph"})
+
+class _GroupAccumulator:
+    """
+    Joins consecutive list items and paragraphs into a single fragment of `content`.
+    Anything else added or appended flushes the pending group first.
+    """
+
+    def __init__(self, content: List):
+        self.content = content
+        self._group: List[str] = []
+
+    def add(self, block_type: str, text: str) -> None:
+        if block_type in _GROUPED_BLOCK_TYPES:
+            self._group.append(text)
+        else:
+            self.append(text)
+
+    def append(self, item: Union[str, Fragments]) -> None:
+        self.flush()
+        self.content.append(item)
+
+    def flush(self) -> None:
+        if self._group:
+            self.content.append(" ".join(self._group))
+            self._group.clear()
+
+async def crawl(
+    notion: _RateLimitedClient,
+    root_id: str,
+    progress_callback: Optional[Callable[[int], None]] = None,
+    root_edited: Optional[str] = None
+) -> Fragments:
+    """
+    Walks the page tree under `root_id` breadth-first and returns its formatted content.
+    Nested pages, databases and blocks go on a work queue that a pool of worker
+    tasks drains concurrently, so there is no recursion and siblings overlap.
+    Each fetch fills the list its parent put in place, so the output keeps
+    document order however the fetches finish. Each ID is queued at most once,
+    which also breaks cycles. `root_edited` is the root page's last_edited_time,
+    if the caller has already retrieved it.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    root: Fragments = []
+    # Only enqueue touches this set, and it never awaits, so workers need no lock.
+    # IDs are kept as 128-bit ints: smaller than UUID strings and cheaper to hash.
+    queued: Set[int] = set()
+
+    def enqueue(
+        fetch: Callable[..., Awaitable[None]],
+        object_id: str,
+        content: Fragments,
+        indent: int,
+        page_edited: Optional[str] = None
+    ) -> None:
+        key = uuid.UUID(object_id).int
+        if key not in queued:
+            queued.add(key)
+            queue.put_nowait((fetch, object_id, content, indent, page_edited))
+
+    async def worker():
+        while True:
+            fetch, object_id, content, indent, page_edited = await queue.get()
+            try:
+                await fetch(notion, object_id, content, enqueue, indent, progress_callback, page_edited)
+            except Exception as e:
+                logger.error(f"Error fetching nested content: {str(e)}")
+            finally:
+                queue.task_done()
+
+    enqueue(fetch_page, root_id, root, 0, root_edited)
+    workers = [asyncio.create_task(worker()) for _ in range(NOTION_CRAWL_WORKERS)]
+    try:
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+    return root
+
+async def fetch_database_entries(
+    notion: _RateLimitedClient,
     database_id: str, 
-    visited: Optional[Set[str]] = None, 
-    progress_callback: Optional[Callable[[int], None]] = None
-) -> List[str]:
+    content: Fragments,
+    enqueue: Enqueue,
+    indent: int = 0,
+    progress_callback: Optional[Callable[[int], None]] = None,
+    page_edited: Optional[str] = None
+) -> None:
     """
-    Recursively fetches entries from a child database and indexes each page.
-    Each new page (database entry) increments the progress counter.
+    Fetches entries from a child database into `content` and queues each page
+    (database entry) for indexing. Each entry increments the progress counter.
+    Queries are never cached, so each entry's `last_edited_time` in the results
+    is fresh and keys the cached listings of that entry's blocks.
     """
-    if visited is None:
-        visited = set()
-    if database_id in visited:
-        return []
-    visited.add(database_id)
-    content = []
     try:
-        cursor = None
-        while True:
-            response = notion.databases.query(database_id=database_id, start_cursor=cursor, page_size=100)
+        async for response in paginate(notion.databases.query, database_id=database_id):
             entries = response.get("results", [])
+            # Query results are full page objects, so entry titles come from
+            # this batched response rather than a pages.retrieve per entry.
             for entry in entries:
-                page_title = ""
-                for prop in entry.get("properties", {}).values():
-                    if prop.get("type") == "title":
-                        page_title = safe_get_text(prop, "title")
-                        break
-                if not page_title:
-                    page_title = "Untitled"
+                page_title = get_page_title(entry) or "Untitled"
                 content.append(f"\n#### {page_title}\n")
                 if progress_callback:
                     progress_callback(1)
-                entry_id = entry.get("id")
-                entry_blocks = fetch_block_children(entry_id, visited=visited, progress_callback=progress_callback)
-                if entry_blocks:
-                    content.extend(entry_blocks)
-            if not response.get("has_more"):
-                break
-            cursor = response.get("next_cursor")
+                entry_content: Fragments = []
+                content.append(entry_content)
+                enqueue(fetch_block_children, entry.get("id"), entry_content, indent, entry.get("last_edited_time"))
     except Exception as e:
         logger.error(f"Error fetching database entries: {str(e)}")
-    return content
 
-def fetch_block_children(
+async def fetch_page(
+    notion: _RateLimitedClient,
+    page_id: str,
+    content: Fragments,
+    enqueue: Enqueue,
+    indent: int = 0,
+    progress_callback: Optional[Callable[[int], None]] = None,
+    page_edited: Optional[str] = None
+) -> None:
+    """
+    Fetches a page's blocks into `content`. With a listing cache, the page's
+    `last_edited_time` is retrieved first unless already known: the child_page
+    block that linked here may come from a replayed listing and be out of date.
+    An empty `page_edited` means an earlier lookup failed; it is not retried.
+    """
+    if notion.listing_cache is not None and page_edited is None:
+        try:
+            page = await notion.pages.retrieve(page_id)
+            page_edited = page.get("last_edited_time")
+        except Exception as e:
+            logger.warning(f"Could not retrieve page {page_id}; indexing it uncached: {str(e)}")
+    await fetch_block_children(notion, page_id, content, enqueue, indent, progress_callback, page_edited)
+
+async def fetch_block_children(
+    notion: _RateLimitedClient,
     block_id: str, 
+    content: Fragments,
+    enqueue: Enqueue,
     indent: int = 0, 
-    visited: Optional[Set[str]] = None,
-    progress_callback: Optional[Callable[[int], None]] = None
-) -> List[str]:
+    progress_callback: Optional[Callable[[int], None]] = None,
+    page_edited: Optional[str] = None
+) -> None:
     """
-    Recursively fetches and formats the block content of a Notion page,
-    handling nested pages and embedded databases.
+    Fetches and formats the child blocks of a Notion block or page into `content`,
+    queueing nested pages, embedded databases and blocks with children as
+    separate fetches whose output lands in place once they run. Nested blocks
+    inherit `page_edited`, since they belong to the same page.
     """
-    if visited is None:
-        visited = set()
-    if block_id in visited:
-        return []
-    visited.add(block_id)
-
-    content = []
+    group = _GroupAccumulator(content)
     try:
-        cursor = None
-        current_group = []
-
-        while True:
-            response = notion.blocks.children.list(
-                block_id=block_id,
-                start_cursor=cursor,
-                page_size=100
-            )
+        async for response in list_block_children(notion, block_id, page_edited):
             blocks = response.get("results", [])
             for b in blocks:
-                block_type = b.get("type", "")
-                
+                # Notion always sends "type" and "id"; read each field once.
+                block_type = b["type"]
+                child_id = b["id"]
+                has_children = b.get("has_children", False)
+
                 # Handle child pages:
                 if block_type == "child_page":
-                    if current_group:
-                        content.append(" ".join(current_group))
-                        current_group = []
+                    # The child_page block carries the title; no page lookup needed.
                     page_title = b.get("child_page", {}).get("title", "Untitled")
-                    content.append(f"\n### {page_title}\n")
+                    group.append(f"\n### {page_title}\n")
                     if progress_callback:
                         progress_callback(1)
-                    child_page_id = b.get("id")
-                    child_content = fetch_block_children(child_page_id, indent + 1, visited, progress_callback)
-                    if child_content:
-                        content.extend(child_content)
+                    child_content: Fragments = []
+                    content.append(child_content)
+                    enqueue(fetch_page, child_id, child_content, indent + 1)
                     continue
 
                 # Handle child databases:
                 if block_type == "child_database":
-                    if current_group:
-                        content.append(" ".join(current_group))
-                        current_group = []
                     db_title = b.get("child_database", {}).get("title", "Database")
-                    content.append(f"\n### Database: {db_title}\n")
-                    database_id = b.get("id")
-                    db_entries = fetch_database_entries(database_id, visited, progress_callback)
-                    if db_entries:
-                        content.extend(db_entries)
+                    group.append(f"\n### Database: {db_title}\n")
+                    child_content = []
+                    content.append(child_content)
+                    enqueue(fetch_database_entries, child_id, child_content, indent)
                     continue
 
                 # Process regular blocks:
-                block_content = process_block(b)
+                block_content = process_block(b, block_type)
                 if not block_content:
                     continue
-
-                # If it's a heading block, flush current group first:
-                if block_type.startswith("heading_"):
-                    if current_group:
-                        content.append(" ".join(current_group))
-                        current_group = []
-                    content.append(block_content)
-                elif block_type in ["bulleted_list_item", "numbered_list_item", "paragraph"]:
-                    current_group.append(block_content)
-                else:
-                    if current_group:
-                        content.append(" ".join(current_group))
-                        current_group = []
-                    content.append(block_content)
+                group.add(block_type, block_content)
 
                 # Check for nested children in the same block:
-                if b.get("has_children", False):
-                    if current_group:
-                        content.append(" ".join(current_group))
-                        current_group = []
-                    child_content = fetch_block_children(b["id"], indent + 1, visited, progress_callback)
-                    if child_content:
-                        content.extend(child_content)
+                if has_children:
+                    child_content = []
+                    group.append(child_content)
+                    enqueue(fetch_block_children, child_id, child_content, indent + 1, page_edited)
 
             # After processing blocks in this batch, flush if needed:
-            if current_group:
-                content.append(" ".join(current_group))
-                current_group = []
-
-            if not response.get("has_more"):
-                break
-            cursor = response.get("next_cursor")
+            group.flush()
 
     except APIResponseError as e:
         logger.error(f"Error fetching blocks for id {block_id}: {str(e)}")
 
-    return content
-
 # ------------------------------------------------------------------------------
 # Query Function Using Gemini 2.0 Flash AI
 # ------------------------------------------------------------------------------
-def query_gemini(content: str, question: str) -> str:
+GEMINI_MODEL_NAME = "gemini-2.0-flash-exp"
+GEMINI_SYSTEM_INSTRUCTION = (
+    "You will be given the recursively indexed content of a Notion page (including subpages and database entries), "
+    "followed by a question. Analyze the content and answer the question."
+)
+# Answers remembered per browser session when "Force refresh" is unticked.
+ANSWER_CACHE_MAX_ENTRIES = 256
+
+@st.cache_resource
+def get_gemini_client() -> genai.Client:
+    """
+    Returns the Gemini client. Streamlit re-executes this script on every
+    interaction, so the client is cached as a resource rather than a module global.
+    """
+    return genai.Client(api_key=GEMINI_API_KEY)
+
+def query_gemini(
+    content: str,
+    question: str,
+    placeholder: Optional[Any] = None,
+    answers: Optional[Dict[Tuple[str, str], str]] = None,
+    content_hash: Optional[str] = None
+) -> str:
     """
     Sends the indexed Notion content and a question to Gemini 2.0 Flash AI.
-    No memory or context is stored between queries.
-    """
-    prompt = (
-        "Below is the recursively indexed content of a Notion page (including subpages and database entries). "
-        "Analyze the content and answer the question that follows.\n\n"
-        f"{content}\n\n"
-        f"Question: {question}\n\n"
-        "Answer:"
-    )
+    No memory or context is stored between queries. The answer is streamed and,
+    if a Streamlit `placeholder` is given, rendered into it as chunks arrive.
+    If an `answers` dict and the content's `content_hash` (computed once, when
+    the content was indexed) are given, an earlier answer to the same question
+    about the same content is returned from it instead, and new answers are added.
+    """
+    question = question.strip()
+    if content_hash is None:
+        answers = None
+    if answers is not None:
+        key = (content_hash, question)
+        if key in answers:
+            return answers[key]
+    # The instructions go in the system instruction and the content and the
+    # question in parts of their own, so the (possibly multi-megabyte) page
+    # text is passed through as is rather than copied into a prompt string.
+    prompt_parts = [content, f"Question: {question}\n\nAnswer:"]
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash-exp")
-        response = model.generate_content(prompt)
-        return response.text.strip() if hasattr(response, "text") else response
+        response = get_gemini_client().models.generate_content_stream(
+            model=GEMINI_MODEL_NAME,
+            contents=prompt_parts,
+            config=types.GenerateContentConfig(system_instruction=GEMINI_SYSTEM_INSTRUCTION),
+        )
+        # Some chunks (e.g. the final one with usage metadata) carry no text.
+        chunks = (chunk.text or "" for chunk in response)
+        if placeholder is not None:
+            answer = placeholder.write_stream(chunks)
+        else:
+            answer = "".join(chunks)
+        answer = answer.strip()
+        if answers is not None:
+            if len(answers) >= ANSWER_CACHE_MAX_ENTRIES:
+                # Dicts keep insertion order; drop the oldest answer.
+                del answers[next(iter(answers))]
+            answers[key] = answer
+        return answer
     except Exception as e:
         logger.error(f"Error querying Gemini: {str(e)}")
         return f"Error querying Gemini: {str(e)}"
 
 # ------------------------------------------------------------------------------
-# Function to Fetch Notion Content (Always Fresh; No Caching)
+# Function to Fetch Notion Content (Fresh by Default; Optional Short-Lived Cache)
 # ------------------------------------------------------------------------------
-def fetch_notion_content(notion_url: str, progress_callback: Optional[Callable[[int], None]] = None) -> str:
+async def report_page_title(notion: AsyncClient, page_id: str) -> Optional[Dict]:
     """
-    Fetch content from a Notion URL by recursively walking the page.
-    This function is called every time a question is asked, ensuring no memory is kept.
+    Retrieves the page's properties and shows its title, or a warning if the
+    integration cannot read page metadata. Returns the page, or None.
     """
-    page_id = extract_page_id(notion_url)
     try:
-        page = notion.pages.retrieve(page_id)
-        title = ""
-        for prop in page.get("properties", {}).values():
-            if prop.get("type") == "title":
-                title = safe_get_text(prop, "title")
-                break
+        page = await notion.pages.retrieve(page_id)
+        title = get_page_title(page)
         st.info(f"Accessed page: {title or 'Untitled'}")
+        return page
     except APIResponseError as e:
         st.warning(
             "Could not retrieve page properties. The integration might not have full access to metadata, "
             "but block-level content will still be indexed."
         )
         logger.warning(f"Page retrieve error: {str(e)}")
+        return None
 
-    st.spinner("Fetching content from Notion...")
-    content_blocks = fetch_block_children(page_id, visited=set(), progress_callback=progress_callback)
-    if not content_blocks:
-        return ""
-    return "\n\n".join(content_blocks)
+@st.cache_resource
+def get_ssl_context() -> ssl.SSLContext:
+    """
+    Returns the TLS context for Notion connections. The client itself cannot be
+    cached (see below), but building a context reloads the CA bundle, which
+    takes tens of milliseconds, and a context is safe to share across loops.
+    """
+    return httpx.create_ssl_context()
+
+async def fetch_notion_content(
+    notion_url: str,
+    progress_callback: Optional[Callable[[int], None]] = None,
+    listing_cache: Optional[diskcache.Cache] = None
+) -> str:
+    """
+    Fetch content from a Notion URL by crawling the page and everything nested
+    under it, with sibling pages, databases and blocks fetched concurrently.
+    Every call builds its own client and visited set, so no memory is kept
+    unless a `listing_cache` is passed to reuse unchanged children listings.
+    """
+    page_id = extract_page_id(notion_url)
+    # httpx connection pools and asyncio primitives are bound to the event loop
+    # that uses them, so each fetch (one asyncio.run) gets its own client.
+    notion = _RateLimitedClient(
+        auth=NOTION_API_KEY,
+        client=httpx.AsyncClient(http2=True, limits=NOTION_HTTP_LIMITS, verify=get_ssl_context()),
+        listing_cache=listing_cache,
+    )
+    try:
+        st.spinner("Fetching content from Notion...")
+        if listing_cache is not None:
+            # Cached listings are keyed by the page's last_edited_time, so the
+            # crawl waits for the title lookup, which also returns it.
+            page = await report_page_title(notion, page_id)
+            # If the lookup failed, "" stops the crawl from repeating it.
+            root_edited = page.get("last_edited_time") if page else ""
+            content_blocks = await crawl(
+                notion, page_id, progress_callback=progress_callback, root_edited=root_edited
+            )
+        else:
+            # The title lookup is independent of the crawl; overlap their round-trips
+            # so startup costs one RTT, not two. Access problems still surface
+            # through report_page_title's warning.
+            _, content_blocks = await asyncio.gather(
+                report_page_title(notion, page_id),
+                crawl(notion, page_id, progress_callback=progress_callback),
+            )
+    finally:
+        await notion.aclose()
+    # Join once; write_blocks yields the pieces in order.
+    pieces: List[str] = []
+    write_blocks(pieces.append, content_blocks)
+    return "".join(pieces)
+
+# How long an indexed page is reused when "Force refresh" is unticked.
+NOTION_CONTENT_TTL_SECONDS = 60
+
+@st.cache_resource
+def get_listing_cache() -> diskcache.Cache:
+    """
+    Opens the on-disk listing cache once per server process. Listings are stored
+    as JSON, as Notion sent them, rather than pickled.
+    """
+    return diskcache.Cache(NOTION_LISTING_CACHE_DIR, disk=diskcache.JSONDisk)
+
+def load_notion_content(
+    notion_url: str,
+    progress_callback: Optional[Callable[[int], None]] = None
+) -> Tuple[str, str]:
+    """
+    Synchronous entry point for fetch_notion_content that reuses this session's
+    copy of the page if it was indexed less than NOTION_CONTENT_TTL_SECONDS ago.
+    Only the text is kept, in `st.session_state`: the fetch draws progress and
+    the page title into the page, which st.cache_data cannot replay on a hit.
+    Once the copy expires, the re-crawl re-fetches only listings that changed.
+    Returns the content and its SHA-256 digest, computed once per fetch.
+    """
+    indexed = st.session_state.get("indexed_page")
+    now = time.monotonic()
+    if indexed and indexed["url"] == notion_url and now - indexed["at"] < NOTION_CONTENT_TTL_SECONDS:
+        return indexed["content"], indexed["hash"]
+    content = asyncio.run(fetch_notion_content(
+        notion_url,
+        progress_callback=progress_callback,
+        listing_cache=get_listing_cache(),
+    ))
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    st.session_state["indexed_page"] = {"url": notion_url, "at": now, "content": content, "hash": content_hash}
+    return content, content_hash
 
 # ------------------------------------------------------------------------------
 # Streamlit UI
 # ------------------------------------------------------------------------------
+# Minimum seconds between progress counter redraws; each one is a websocket message.
+PROGRESS_UPDATE_INTERVAL = 0.1
+
 def main():
     st.title("Notion Page QA (Memoryless) with Gemini 2.0 Flash")
     st.markdown(
         """
         This app lets you enter a Notion page URL (with proper integration) and ask questions
-        about its content. The page is fully indexed each time you ask a question—absolutely no caching 
-        or memory from previous runs. The answer is generated using Gemini 2.0 Flash AI.
+        about its content. With "Force refresh" on (the default) the page is fully indexed each time
+        you ask a question—no caching or memory from previous runs. Turn it off to reuse the indexed
+        page for up to a minute while asking follow-up questions. The answer is generated using Gemini 2.0 Flash AI.
         """
     )
 
     notion_url = st.text_input("Enter Notion Page URL", placeholder="https://www.notion.so/your-page-url")
 
     # Simple progress counter for demonstration
-    progress_state = {"count": 0}
+    progress_state = {"count": 0, "shown": 0, "shown_at": 0.0}
     progress_placeholder = st.empty()
 
+    def show_progress():
+        progress_state["shown"] = progress_state["count"]
+        progress_state["shown_at"] = time.monotonic()
+        progress_placeholder.text(f"Indexed pages: {progress_state['count']}")
+
     def progress_callback(n: int):
+        # Count every page, but redraw at most once per interval.
         progress_state["count"] += n
-        progress_placeholder.text(f"Indexed pages: {progress_state['count']}")
+        if time.monotonic() - progress_state["shown_at"] >= PROGRESS_UPDATE_INTERVAL:
+            show_progress()
 
     question = st.text_input("Ask a question about the above Notion page", 
                              placeholder="e.g., What is the main objective?")
+    force_refresh = st.checkbox("Force refresh (re-index the page for every question)", value=True)
 
     if st.button("Get Answer") and notion_url.strip() and question.strip():
-        # We fetch the content from scratch every time
-        with st.spinner("Indexing Notion page (memoryless fetch)..."):
+        # Unless the user opted into reuse, fetch the content from scratch
+        fetch_message = (
+            "Indexing Notion page (memoryless fetch)..." if force_refresh
+            else "Loading Notion page (reusing recently indexed content)..."
+        )
+        with st.spinner(fetch_message):
             progress_state["count"] = 0
-            notion_content = fetch_notion_content(notion_url, progress_callback=progress_callback)
+            if force_refresh:
+                # Bypass the cache entirely so memoryless fetches leave nothing behind.
+                notion_content = asyncio.run(fetch_notion_content(notion_url, progress_callback=progress_callback))
+                content_hash = None
+            else:
+                notion_content, content_hash = load_notion_content(notion_url, progress_callback)
+            # Show the final count if the last updates fell inside an interval.
+            if progress_state["count"] != progress_state["shown"]:
+                show_progress()
 
         if not notion_content:
             st.error("No content found in the page.")
@@ -347,10 +830,24 @@ def main():
             st.success("Content indexed successfully!")
             with st.expander("Show Indexed Content (optional debugging)"):
                 st.text_area("Indexed Content", notion_content, height=300)
-            with st.spinner("Querying Gemini 2.0 Flash (memoryless AI)..."):
-                answer = query_gemini(notion_content, question)
             st.markdown("**Answer:**")
-            st.write(answer)
+            answer_placeholder = st.empty()
+            # Session state survives reruns, so follow-up questions in reuse
+            # mode can skip Gemini for questions already answered.
+            answers = None if content_hash is None else st.session_state.setdefault("answers", {})
+            query_message = (
+                "Querying Gemini 2.0 Flash (memoryless AI)..." if force_refresh
+                else "Querying Gemini 2.0 Flash (reusing earlier answers)..."
+            )
+            with st.spinner(query_message):
+                answer = query_gemini(
+                    notion_content,
+                    question,
+                    placeholder=answer_placeholder,
+                    answers=answers,
+                    content_hash=content_hash,
+                )
+            answer_placeholder.write(answer)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,203 @@
+"""
+Runs NotionAgent.py under Streamlit's AppTest with the Notion and Gemini APIs mocked.
+"""
+import os
+from unittest import mock
+
+import httpx
+import pytest
+import streamlit as st
+from notion_client.errors import APIResponseError, RequestTimeoutError
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "NotionAgent.py")
+PAGE_ID = "0123456789abcdef0123456789abcdef"
+
+
+def _rich_text(text):
+    return [{"type": "text", "plain_text": text}]
+
+
+CHILD_PAGE_ID = "22222222222222222222222222222222"
+TOGGLE_ID = "33333333333333333333333333333333"
+EDITED = "2020-01-01T00:00:00.000Z"
+
+
+def _block(block_id, block_type, text=None, has_children=False, **fields):
+    data = {"rich_text": _rich_text(text)} if text is not None else {}
+    data.update(fields)
+    return {
+        "object": "block",
+        "id": block_id,
+        "type": block_type,
+        "has_children": has_children,
+        "last_edited_time": EDITED,
+        block_type: data,
+    }
+
+
+class FakeNotion:
+    """
+    Stands in for AsyncClient.request. The page holds a paragraph and a subpage;
+    the subpage holds a toggle whose child paragraph reads `self.nested_text`.
+    """
+
+    def __init__(self):
+        self.nested_text = "Nested text"
+        self.page_edited = {PAGE_ID: EDITED, CHILD_PAGE_ID: EDITED}
+        # Page IDs whose pages.retrieve raises the given exception.
+        self.retrieve_errors = {}
+        self.calls = []
+
+    def children(self, block_id):
+        if block_id == PAGE_ID:
+            return [
+                _block("11111111111111111111111111111111", "paragraph", "Hello from Notion"),
+                _block(CHILD_PAGE_ID, "child_page", has_children=True, title="Subpage"),
+            ]
+        if block_id == CHILD_PAGE_ID:
+            return [_block(TOGGLE_ID, "toggle", "Details", has_children=True)]
+        if block_id == TOGGLE_ID:
+            return [_block("44444444444444444444444444444444", "paragraph", self.nested_text)]
+        return []
+
+    async def request(self, path, method, query=None, body=None, auth=None):
+        self.calls.append(path)
+        kind, object_id = path.split("/")[:2]
+        object_id = object_id.replace("-", "")
+        if kind == "pages":
+            if object_id in self.retrieve_errors:
+                raise self.retrieve_errors[object_id]
+            return {
+                "object": "page",
+                "id": object_id,
+                "last_edited_time": self.page_edited[object_id],
+                "properties": {"title": {"type": "title", "title": _rich_text("Test page")}},
+            }
+        if kind == "blocks" and path.endswith("/children"):
+            return {"results": self.children(object_id), "has_more": False, "next_cursor": None}
+        raise AssertionError(f"unexpected Notion request: {method} {path}")
+
+
+class FakeGemini:
+    """
+    Stands in for google.genai.Client, answering every question with one chunk.
+    Each call's contents are recorded in `FakeGemini.calls`.
+    """
+
+    calls = []
+
+    def __init__(self, **kwargs):
+        self.models = self
+
+    def generate_content_stream(self, model, contents, config=None):
+        FakeGemini.calls.append(contents)
+        return iter([mock.Mock(text="The answer.")])
+
+
+@pytest.fixture
+def notion(tmp_path, monkeypatch):
+    # The listing cache is created relative to the working directory; drop the
+    # one a previous test opened elsewhere.
+    monkeypatch.chdir(tmp_path)
+    st.cache_resource.clear()
+    FakeGemini.calls.clear()
+    fake = FakeNotion()
+
+    async def request(client, *args, **kwargs):
+        return await fake.request(*args, **kwargs)
+
+    with mock.patch("notion_client.AsyncClient.request", request), \
+            mock.patch("google.genai.Client", FakeGemini):
+        yield fake
+
+
+def ask(at, question, force_refresh):
+    at.text_input[0].input(PAGE_ID)
+    at.text_input[1].input(question)
+    at.checkbox[0].set_value(force_refresh)
+    at.button[0].click()
+    at.run()
+    assert not at.exception
+    return at
+
+
+def test_repeat_question_reuses_indexed_page(notion):
+    at = AppTest.from_file(APP_PATH, default_timeout=10)
+    at.secrets["GEMINI_API_KEY"] = "test"
+    at.run()
+
+    ask(at, "What is this page?", force_refresh=False)
+    fetches = len(notion.calls)
+    assert fetches > 0
+    ask(at, "What is this page?", force_refresh=False)
+    ask(at, "Anything else?", force_refresh=False)
+
+    assert len(notion.calls) == fetches
+    assert "The answer." in [m.value for m in at.markdown]
+
+
+def test_repeat_question_reuses_answer(notion):
+    at = AppTest.from_file(APP_PATH, default_timeout=10)
+    at.secrets["GEMINI_API_KEY"] = "test"
+    at.run()
+
+    ask(at, "What is this page?", force_refresh=False)
+    ask(at, "  What is this page? ", force_refresh=False)
+
+    assert len(FakeGemini.calls) == 1
+    assert FakeGemini.calls[0][-1] == "Question: What is this page?\n\nAnswer:"
+    assert "The answer." in [m.value for m in at.markdown]
+
+
+def indexed_content(at):
+    return at.text_area[0].value
+
+
+def test_listing_cache_follows_page_edits(notion):
+    at = AppTest.from_file(APP_PATH, default_timeout=10)
+    at.secrets["GEMINI_API_KEY"] = "test"
+    at.run()
+    toggle_listing = f"blocks/{TOGGLE_ID}/children"
+
+    def toggle_listings():
+        return sum(1 for path in notion.calls if path.replace("-", "") == toggle_listing)
+
+    ask(at, "What is this page?", force_refresh=False)
+    assert "Nested text" in indexed_content(at)
+    assert toggle_listings() == 1
+
+    # Once this session's copy is gone, an unchanged page is re-crawled from
+    # the listing cache.
+    del at.session_state["indexed_page"]
+    ask(at, "What is this page?", force_refresh=False)
+    assert "Nested text" in indexed_content(at)
+    assert toggle_listings() == 1
+
+    # Editing a block under the toggle advances only the page's timestamp.
+    notion.nested_text = "Edited text"
+    notion.page_edited[CHILD_PAGE_ID] = "2020-01-02T00:00:00.000Z"
+    del at.session_state["indexed_page"]
+    ask(at, "What is this page?", force_refresh=False)
+    assert "Edited text" in indexed_content(at)
+    assert toggle_listings() == 2
+
+
+def test_failed_page_lookups_still_index_the_page(notion):
+    at = AppTest.from_file(APP_PATH, default_timeout=10)
+    at.secrets["GEMINI_API_KEY"] = "test"
+    at.run()
+    notion.retrieve_errors[CHILD_PAGE_ID] = RequestTimeoutError()
+    notion.retrieve_errors[PAGE_ID] = APIResponseError(
+        httpx.Response(403, request=httpx.Request("GET", "https://api.notion.com")),
+        "Insufficient permissions",
+        "restricted_resource",
+    )
+
+    ask(at, "What is this page?", force_refresh=False)
+
+    assert "Hello from Notion" in indexed_content(at)
+    assert "Nested text" in indexed_content(at)
+    # The root's failed lookup is not repeated by the crawl.
+    root_retrieves = [path for path in notion.calls if path.replace("-", "") == f"pages/{PAGE_ID}"]
+    assert len(root_retrieves) == 1
@@ -0,0 +1,105 @@
+"""
+Tests _RateLimitedClient's retries against a mocked Notion transport.
+"""
+import asyncio
+import importlib
+import os
+import sys
+import time
+from unittest import mock
+
+import httpx
+import pytest
+import streamlit as st
+from notion_client.errors import APIResponseError, HTTPResponseError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+@pytest.fixture(scope="module")
+def agent():
+    # The module reads its API keys from st.secrets at import.
+    with mock.patch.object(st, "secrets", {"GEMINI_API_KEY": "test"}):
+        return importlib.import_module("NotionAgent")
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(agent, monkeypatch):
+    monkeypatch.setattr(agent, "NOTION_RETRY_BASE_DELAY", 0.001)
+
+
+def _page(page_id):
+    return {"object": "page", "id": page_id, "last_edited_time": "2020-01-01T00:00:00.000Z", "properties": {}}
+
+
+def _error(status, code, **headers):
+    return httpx.Response(status, headers=headers, json={"object": "error", "status": status, "code": code, "message": code})
+
+
+def run_client(agent, handler, coro_fn):
+    async def main():
+        notion = agent._RateLimitedClient(
+            auth="test",
+            client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+        try:
+            return await coro_fn(notion)
+        finally:
+            await notion.aclose()
+    return asyncio.run(main())
+
+
+def test_retries_rate_limits_and_server_errors(agent):
+    responses = [
+        _error(429, "rate_limited", **{"Retry-After": "0.2"}),
+        _error(503, "service_unavailable"),
+        None,
+    ]
+    # (page id, send time) of every request.
+    sent = []
+
+    def handler(request):
+        page_id = request.url.path.rsplit("/", 1)[-1]
+        sent.append((page_id, time.monotonic()))
+        response = responses.pop(0) if page_id == "a" else None
+        return response or httpx.Response(200, json=_page(page_id))
+
+    async def retrieve_both(notion):
+        first = asyncio.ensure_future(notion.pages.retrieve("a"))
+        # Started while the Retry-After pause is in effect, so it waits too.
+        await asyncio.sleep(0.05)
+        second = await notion.pages.retrieve("b")
+        return await first, second
+
+    first, second = run_client(agent, handler, retrieve_both)
+
+    assert first["id"] == "a" and second["id"] == "b"
+    assert [page_id for page_id, _ in sent].count("a") == 3
+    rate_limited_at = sent[0][1]
+    assert all(at - rate_limited_at >= 0.19 for _, at in sent[1:])
+
+
+def test_gives_up_after_max_retries(agent):
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return _error(502, "bad_gateway")
+
+    with pytest.raises(HTTPResponseError) as error:
+        run_client(agent, handler, lambda notion: notion.pages.retrieve("a"))
+    assert error.value.status == 502
+    assert len(sent) == agent.NOTION_MAX_RETRIES + 1
+
+
+def test_client_errors_are_not_retried(agent):
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        return _error(404, "object_not_found")
+
+    with pytest.raises(APIResponseError) as error:
+        run_client(agent, handler, lambda notion: notion.pages.retrieve("a"))
+    assert error.value.status == 404
+    assert len(sent) == 1